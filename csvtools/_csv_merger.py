@@ -2,11 +2,16 @@
 
 """Class to handle csv files merging."""
 
+import codecs
+import csv
 import os
 import shutil
+from collections import OrderedDict
 
 from yaptools import alphanum_sort, _alphanum_key, check_type_validity
 
+from csvtools._utils import COPY_BUFFER_SIZE, is_ascii_compatible
+
 
 class CsvMerger:
     """Class to handle csv files merging with minimum memory usage.
@@ -89,7 +94,7 @@ class CsvMerger:
         # Generate and write the output file's header.
         global_header = self.get_staged_files_header()
         with open(output_path, 'w', encoding=encoding) as outfile:
-            outfile.write(sep.join(global_header) + '\n')
+            self._get_csv_writer(outfile, sep).writerow(global_header)
         # Merge staged files into the final one. Optionally remove them.
         if sort_files:
             self.staged_files.sort(key=lambda x: _alphanum_key(x[0]))
@@ -121,40 +126,56 @@ class CsvMerger:
         merged_encoding : encoding of the merged csv file
         """
         # Arguments serve modularity, hence pylint: disable=too-many-arguments
+        # Steps are best kept together, hence pylint: disable=too-many-locals
         main_header = self._read_header(main_file, main_sep, main_encoding)
+        merged_header = (
+            self._read_header(merged_file, merged_sep, merged_encoding)
+        )
+        # Check file headers' compatibility.
+        main_columns = set(main_header)
+        missing = [
+            column for column in merged_header if column not in main_columns
+        ]
+        if missing:
+            raise ValueError(
+                "Some columns of the merged file do not appear in "
+                + "the main one: ['%s']" % "', '".join(missing)
+            )
+        # Merge the second file into the main one.
+        is_copy = (
+            main_header == merged_header and main_sep == merged_sep
+            and codecs.lookup(main_encoding).name
+            == codecs.lookup(merged_encoding).name
+            and is_ascii_compatible(main_encoding)
+        )
+        if is_copy:
+            # Copy raw bytes, skipping the merged file's header.
+            with open(main_file, 'ab') as outfile:
+                with open(merged_file, 'rb') as infile:
+                    infile.readline()
+                    shutil.copyfileobj(infile, outfile, COPY_BUFFER_SIZE)
+            return None
+        index = self._build_index(merged_header, main_header)
         with open(main_file, 'a', encoding=main_encoding) as outfile:
-            with open(merged_file, encoding=merged_encoding) as infile:
-                merged_header = (
-                    self._parse_csv_row(infile.readline(), merged_sep)
+            with open(
+                merged_file, encoding=merged_encoding, newline=''
+            ) as infile:
+                reader = csv.reader(infile, delimiter=merged_sep)
+                next(reader, None)
+                writer = self._get_csv_writer(outfile, main_sep)
+                writer.writerows(
+                    [fields[i] if i is not None else '' for i in index]
+                    for fields in reader
                 )
-                # Check file headers' compatibility.
-                missing = [
-                    column for column in merged_header
-                    if column not in main_header
-                ]
-                if missing:
-                    raise ValueError(
-                        "Some columns of the merged file do not appear in "
-                        + "the main one: ['%s']" % "', '".join(missing)
-                    )
-                # Merge the second file into the main one.
-                if main_header == merged_header:
-                    shutil.copyfileobj(infile, outfile)
-                else:
-                    index = self._build_index(merged_header, main_header)
-                    for row in infile:
-                        row = self._sort_csv_row(row, index, merged_sep)
-                        outfile.write(main_sep.join(row) + '\n')
 
     def get_staged_files_header(self):
         """Return a list covering the union of staged files' columns."""
-        global_header = []
+        # Use an ordered dict as an insertion-ordered set of column names.
+        global_header = OrderedDict()
         headers = map(lambda args: self._read_header(*args), self.staged_files)
         for file_header in headers:
-            global_header.extend([
-                name for name in file_header if name not in global_header
-            ])
-        return global_header
+            global_header.update(OrderedDict.fromkeys(file_header))
+        return list(global_header)
 
     def _read_header(self, path, sep, encoding):
         """Read a csv file's header."""
@@ -165,35 +186,27 @@ class CsvMerger:
     @staticmethod
     def _parse_csv_row(row, sep):
         """Parse a given csv file row along its value separator."""
-        row = row.strip('\n')
-        protected = False
-        start = 0
-        fields = []
-        for i, char in enumerate(row):
-            if char == sep and not protected:
-                fields.append(row[start:i])
-                start = i + 1
-            elif char == '"':
-                protected = not protected
-        fields.append(row[start:])
-        return fields
+        # Rows without text delimiters may simply be split.
+        if '"' not in row:
+            return row.rstrip('\r\n').split(sep)
+        return next(csv.reader([row], delimiter=sep, quotechar='"'))
+
+    @staticmethod
+    def _get_csv_writer(csv_file, sep):
+        """Return a csv.writer quoting fields only when needed."""
+        return csv.writer(
+            csv_file, delimiter=sep, quotechar='"',
+            quoting=csv.QUOTE_MINIMAL, lineterminator='\n'
+        )
 
     @staticmethod
     def _build_index(local_header, global_header):
-        """Return an index list aligning records of csv files of given headers.
+        """Return an index tuple aligning rows of csv files of given headers.
 
         local_header  : header of the csv file whose rows to sort
         global_header : header of the csv file to write rows to
         """
-        index = []
-        for name in global_header:
-            try:
-                index.append(local_header.index(name))
-            except ValueError:
-                index.append(None)
-        return index
-
-    def _sort_csv_row(self, row, index, sep):
-        """Parse a csv row and align its values according to a given index."""
-        fields = self._parse_csv_row(row, sep)
-        return [fields[i] if i is not None else '' for i in index]
+        positions = {}
+        for i, name in enumerate(local_header):
+            positions.setdefault(name, i)
+        return tuple(positions.get(name) for name in global_header)
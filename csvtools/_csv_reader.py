@@ -8,6 +8,22 @@ import pandas as pd
 from yaptools import check_type_validity, lazyproperty
 from yaptools.logger import LoggedObject, loggedmethod
 
+from csvtools._utils import count_lines
+
+try:
+    import pyarrow
+    import pyarrow.csv
+except ImportError:
+    pyarrow = None
+
+
+# Reading options supported by the pyarrow backend, which (unlike pandas)
+# infers column types once and for all from the first block of data.
+PYARROW_KWARGS = {
+    'chunksize', 'delimiter', 'encoding', 'header', 'index_col',
+    'names', 'nrows', 'quotechar', 'sep', 'skiprows', 'usecols'
+}
+
 
 class LargeCsvReader(LoggedObject):
     """Class to read a large csv file by chunks.
@@ -16,15 +32,27 @@ class LargeCsvReader(LoggedObject):
     options and allowing to read a single file multiple times without
     specifying all parameters again. It also improves columns naming
     when skipping rows, provides with the total file's size, etc.
+
+    Data may optionally be parsed using 'pyarrow.csv' instead, which
+    relies on multithreaded parsing. The latter backend only supports
+    a subset of the reading options, listed in PYARROW_KWARGS. Note
+    that it infers column types from the file's first block of data,
+    and raises a pyarrow.ArrowInvalid exception while reading if some
+    later values do not fit them (e.g. text among integers).
     """
 
-    def __init__(self, filepath, chunksize=10000, logger=None, **kwargs):
+    def __init__(
+            self, filepath, chunksize=10000, logger=None, backend='pandas',
+            **kwargs
+        ):
         """Initialize the csv reader.
 
         filepath  : path to a csv file
         chunksize : number of rows to fetch at once (int, default 10000)
         logger    : optional Logger object to use instead of the default
                     one (which logs everything to the console)
+        backend   : name of the library to use so as to parse data,
+                    either 'pandas' (default) or 'pyarrow'
 
         Additionally, any valid keyword arguments for csv reading using
         the 'pandas.read_csv' function may be passed.
@@ -45,6 +73,12 @@ class LargeCsvReader(LoggedObject):
         if chunksize <= 0:
             raise ValueError('Negative chunksize value.')
         self.chunksize = chunksize
+        check_type_validity(backend, str, 'backend')
+        if backend not in ('pandas', 'pyarrow'):
+            raise ValueError("Unknown backend: '%s'." % backend)
+        if backend == 'pyarrow' and pyarrow is None:
+            raise ImportError("The 'pyarrow' backend requires pyarrow.")
+        self.backend = backend
         if 'filepath_or_buffer' in kwargs.keys():
             raise KeyError("Forbidden keyword argument: 'filepath_or_buffer'.")
         self.kwargs = kwargs
@@ -58,8 +92,7 @@ class LargeCsvReader(LoggedObject):
     @lazyproperty
     def _len(self):
         """Return the csv file's number of rows."""
-        with open(self.filepath, encoding=self.kwargs['encoding']) as csv_file:
-            nrows = sum(1 for _ in csv_file)
+        nrows = count_lines(self.filepath, self.kwargs['encoding'])
         return nrows - (self.kwargs.get('header', '') is not None)
 
     @lazyproperty
@@ -127,13 +160,94 @@ class LargeCsvReader(LoggedObject):
                 + 'while loading multiple columns.'
             )
         # Read file and return it using proper parameters and format.
-        data = pd.read_csv(self.filepath, **kwargs)
+        if self.backend == 'pyarrow':
+            data = self.__read_with_pyarrow(kwargs)
+        else:
+            data = pd.read_csv(self.filepath, **kwargs)
         if not as_series:
             return data
         if at_once:
             return data.iloc[:, 0]
         return map(lambda x: x.iloc[:, 0], data)
 
+    def __read_with_pyarrow(self, kwargs):
+        """Read the csv file using 'pyarrow.csv', mimicking 'pandas.read_csv'.
+
+        Return either a pandas.DataFrame or, if a `chunksize` argument
+        is set, an iterator over pandas.DataFrame chunks.
+        """
+        # Check the reading arguments' compatibility with pyarrow.
+        unsupported = set(kwargs.keys()).difference(PYARROW_KWARGS)
+        if unsupported:
+            raise ValueError(
+                "Unsupported arguments by the pyarrow backend: '%s'."
+                % "', '".join(sorted(unsupported))
+            )
+        names = kwargs.get('names')
+        header = kwargs.get('header', 'infer')
+        if header == 'infer':
+            header = 0 if names is None else None
+        skiprows = kwargs.get('skiprows', 0)
+        if header not in (0, None) or not isinstance(skiprows, int):
+            raise ValueError(
+                "The pyarrow backend only supports a single header row "
+                + "and an integer number of rows to skip."
+            )
+        if header is None and names is None:
+            raise ValueError(
+                'The pyarrow backend requires column names to be provided '
+                + 'when reading a file without header.'
+            )
+        # Set up pyarrow reading options.
+        read_options = pyarrow.csv.ReadOptions(
+            skip_rows=skiprows + int(header == 0 and names is not None),
+            column_names=names, encoding=kwargs['encoding']
+        )
+        parse_options = pyarrow.csv.ParseOptions(
+            delimiter=kwargs.get('sep', kwargs.get('delimiter', ',')),
+            quote_char=kwargs.get('quotechar', '"')
+        )
+        convert_options = pyarrow.csv.ConvertOptions()
+        if kwargs.get('usecols'):
+            # Follow the file's columns order, as pandas does.
+            usecols = set(kwargs['usecols'])
+            convert_options.include_columns = [
+                column for column in self.columns if column in usecols
+            ]
+        # Read the file and convert its contents to pandas.DataFrame.
+        index_col = kwargs.get('index_col')
+        def to_pandas(table, offset=0):
+            """Convert a pyarrow.Table into a pandas.DataFrame.
+
+            Unless an index column is set, rows are indexed from `offset`
+            onwards, so that chunks' indexes follow each other as with
+            pandas.read_csv.
+            """
+            data = table.to_pandas()
+            if index_col is not None and index_col is not False:
+                data = data.set_index(
+                    data.columns[index_col] if isinstance(index_col, int)
+                    else index_col
+                )
+            elif offset:
+                data.index = pd.RangeIndex(offset, offset + len(data))
+            return data
+        def iter_frames(tables):
+            """Yield pandas.DataFrame chunks from pyarrow.Table ones."""
+            offset = 0
+            for table in tables:
+                yield to_pandas(table, offset)
+                offset += table.num_rows
+        reader = pyarrow.csv.open_csv(
+            self.filepath, read_options, parse_options, convert_options
+        )
+        tables = _iter_tables(
+            reader, kwargs.get('chunksize'), kwargs.get('nrows')
+        )
+        if 'chunksize' not in kwargs.keys():
+            return to_pandas(next(tables))
+        return iter_frames(tables)
+
     @staticmethod
     def __manage_usecols(kwargs, usecols):
         """Handle `usecols` argument at LargeCorpus.read()."""
@@ -160,9 +274,11 @@ class LargeCsvReader(LoggedObject):
 
     def __check_usecols_validity(self, kwargs):
         """Ensure specified columns to load at LargeCorpus.read() exist."""
+        if not kwargs.get('usecols'):
+            return None
+        columns = set(self.columns)
         bad_columns = [
-            column for column in kwargs.get('usecols', [])
-            if column not in self.columns
+            column for column in kwargs['usecols'] if column not in columns
         ]
         if bad_columns:
             raise KeyError(
@@ -191,3 +307,30 @@ class LargeCsvReader(LoggedObject):
             - int(kwargs.get('index_col') is not None)
         )
         return n_columns == 1
+
+
+def _iter_tables(reader, chunksize=None, nrows=None):
+    """Yield pyarrow.Table objects of given size from a batches reader.
+
+    reader    : pyarrow reader yielding data by record batches
+    chunksize : number of rows per table (if None, a single table
+                gathering all rows is yielded)
+    nrows     : optional maximum total number of rows to yield
+    """
+    batches = []
+    n_buffered = 0
+    for batch in reader:
+        if nrows is not None:
+            batch = batch.slice(0, nrows)
+            nrows -= batch.num_rows
+        batches.append(batch)
+        n_buffered += batch.num_rows
+        while chunksize is not None and n_buffered >= chunksize:
+            table = pyarrow.Table.from_batches(batches, reader.schema)
+            yield table.slice(0, chunksize)
+            batches = table.slice(chunksize).to_batches()
+            n_buffered -= chunksize
+        if nrows == 0:
+            break
+    if n_buffered or chunksize is None:
+        yield pyarrow.Table.from_batches(batches, reader.schema)
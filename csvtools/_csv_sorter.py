@@ -6,10 +6,24 @@ import os
 import heapq
 import tempfile
 import shutil
+import subprocess
+import functools
+import itertools
+import math
+from contextlib import closing
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+)
 
 import numpy as np
 from yaptools import _alphanum_key, check_type_validity
 
+from csvtools._utils import count_lines, is_ascii_compatible
+
+
+FLOAT_DIGITS = 15  # number of decimal digits that floats hold exactly
+READ_BUFFER_SIZE = 1 << 16  # size (in bytes) of temporary files' read buffer
+
 
 # No need for more methods, hence pylint: disable=too-few-public-methods
 class CsvSorter:
@@ -20,13 +34,16 @@ class CsvSorter:
     More precisely, the sorting procedure is the following:
       1. The initial file is read by chunks, each of which is (locally)
          sorted and stored to a temporary file. Here, sorting is based
-         on the 'sorted' built-in function, and its cost relies on the
-         chunks' size.
+         on the 'list.sort' built-in method, and its cost relies on the
+         chunks' size. Columns holding numbers are sorted by value,
+         using numpy's mergesort whenever a chunk only holds numbers.
       2. The former temporary files are read from by the 'heapq.merge'
          function, which creates a generator yielding sorted results.
          The binary heap sorting algorithm's efficiency (O(log n)) is
          doubled with the memory-costless nature of using a generator
-         instead of sorting everything in memory at once.
+         instead of sorting everything in memory at once. When sorting
+         values are all numbers, rows are rather merged by blocks using
+         numpy's mergesort, with similar memory costs.
       3. If there are too many "initial" temporary files to read all
          of them at once, the former step is conducted iteratively on
          sets of temporary files, until all rows have been sorted into
@@ -56,21 +73,41 @@ class CsvSorter:
         + 'sorting-million-32-bit-integers-in-2mb.html'
     ))
 
-    def __init__(self, chunksize=2000, max_open=200):
+    def __init__(
+            self, chunksize=2000, max_open=200, pool_size=1,
+            use_sort_command=False
+        ):
         """Initialize the object.
 
         chunksize : number of lines per temporary file - thus also the
                     maximum number of lines sorted through loading in
                     memory (int, default 2000)
         max_open  : maximum number of files that can be opened (read from)
-                    at the same time (int, default 200)
+                    at the same time by a merging thread (int, default 200)
+        pool_size : number of processes between which to divide the
+                    sorting of initial chunks, and of threads between
+                    which to divide the merging of temporary files (int,
+                    default 1) ; note that up to twice as many chunks
+                    may then be held in memory at once
+        use_sort_command : whether to delegate sorting along a column to
+                           the GNU 'sort' command when it is available
+                           (bool, default False) ; note that it places
+                           non-numbers first when sorting numbers, and
+                           uses version sort (-V) rather than a strictly
+                           alphanumeric order otherwise
         """
         check_type_validity(chunksize, int, 'chunksize')
         check_type_validity(max_open, int, 'max_open')
+        check_type_validity(pool_size, int, 'pool_size')
+        check_type_validity(use_sort_command, bool, 'use_sort_command')
+        if pool_size <= 0:
+            raise ValueError('Invalid pool size value: negative integer.')
         self.tempdir = tempfile.mkdtemp()
         shutil.rmtree(self.tempdir)
         self.chunksize = chunksize
         self.max_open = max_open
+        self.pool_size = pool_size
+        self.use_sort_command = use_sort_command
 
     def sort_file(
             self, input_file, output_file, sorting_axis,
@@ -86,11 +123,18 @@ class CsvSorter:
         has_header   : whether the file has a header row
                        (bool, default True)
         sep          : value separator of the file (str, default ',')
-        encoding     : encoding of the file (str, default 'utf-8')
+        encoding     : encoding of the file (str, default 'utf-8') ; the
+                       sorted file is written using the same encoding,
+                       unless it is not ascii-compatible (e.g. utf-16),
+                       in which case utf-8 is used
 
         Note: If `sorting_axis` is neither None (random) or the first column,
               the value separator must *not* appear inside value fields (i.e.
               within strings).
+
+        Note: If the first rows' sorting values are all numbers, numbers are
+              sorted by value and placed ahead of any other values. Otherwise,
+              values are sorted along an alphanumeric order.
         """
         # Arguments serve modularity, hence pylint: disable=too-many-arguments
         # Check arguments validity.
@@ -110,59 +154,204 @@ class CsvSorter:
             raise ValueError(
                 "Cannot infer sorting column's position without a header."
             )
+        # Optionally delegate sorting to the GNU sort command.
+        use_command = (
+            self.use_sort_command and sorting_axis is not None
+            and is_ascii_compatible(encoding)
+            and len(sep) == 1 and ord(sep) < 128 and _has_gnu_sort()
+        )
+        if use_command:
+            self._sort_with_command(
+                input_file, output_file, sorting_axis, has_header,
+                sep.encode(encoding), encoding
+            )
+            return None
         # Conduct sorting.
-        header, sorting_key = self._initial_step(
+        header, sorting_key, numbers_only = self._initial_step(
             input_file, has_header, sorting_axis, sep, encoding
         )
-        final_step = self._merging_steps(sorting_key)
+        final_step = self._merging_steps(sorting_key, numbers_only)
         self._cleanup_step(
-            output_file, final_step, header, (sorting_axis is None), sep
+            output_file, final_step, header, (sorting_axis is None),
+            sep.encode(_get_rows_encoding(encoding))
         )
 
+    def _sort_with_command(
+            self, input_file, output_file, sorting_axis, has_header, sep,
+            encoding='utf-8'
+        ):
+        """Sort a csv file along one of its columns using GNU sort.
+
+        The file's encoding must be ascii-compatible, and its value
+        separator must be a single ascii character (passed as bytes).
+        """
+        # Arguments serve modularity, hence pylint: disable=too-many-arguments
+        # Steps are best kept together, hence pylint: disable=too-many-locals
+        with open(input_file, 'rb') as initial_file:
+            header = initial_file.readline() if has_header else b''
+            if isinstance(sorting_axis, str):
+                sorting_axis = header.rstrip(b'\r\n').split(sep).index(
+                    sorting_axis.encode(encoding)
+                )
+            # Sort numbers by value if the first chunk only holds some.
+            rows = list(itertools.islice(initial_file, self.chunksize))
+            values = [row.split(sep)[sorting_axis] for row in rows]
+            numeric = _parse_numbers(values) is not None
+        # Bound the command's memory use to that of as many chunks
+        # as the in-process algorithm would hold at once.
+        buffer_size = max(sum(map(len, rows)), 1) * self.pool_size
+        # Write the header and have the command sort the other rows.
+        column = sorting_axis + 1
+        command = [
+            'sort', '--stable', '--field-separator=' + sep.decode(),
+            '--key=%s,%s%s' % (column, column, 'g' if numeric else 'fV'),
+            '--parallel=%s' % self.pool_size,
+            '--buffer-size=%sb' % buffer_size,
+            '--temporary-directory=' + tempfile.gettempdir()
+        ]
+        with open(input_file, 'rb', buffering=0) as initial_file:
+            initial_file.seek(len(header))
+            with open(output_file, 'wb') as output:
+                output.write(header)
+                output.flush()
+                subprocess.check_call(
+                    command, stdin=initial_file, stdout=output,
+                    env=dict(os.environ, LC_ALL='C')
+                )
+        print("Successfully sorted the file to '%s'." % output_file)
+
     def _initial_step(self, filepath, has_header, sorting_axis, sep, encoding):
         """Cut the initial file into sorted temporary files.
 
-        Return the file's header, if any, and a row-sorting key function.
+        Rows are handled as bytes, transcoded to utf-8 if the file's
+        encoding is not ascii-compatible.
+
+        Return the file's header, if any, a row-sorting key function
+        and a bool indicating whether all sorting values are numbers.
         """
+        # Steps are best kept together, hence pylint: disable=too-many-locals
         # Compute the number of initial temporary files to create.
-        with open(filepath, encoding='utf-8') as initial_file:
-            n_rows = sum(1 for _ in initial_file) - int(has_header)
+        n_rows = count_lines(filepath, encoding) - int(has_header)
         n_tempfiles = (
             n_rows // self.chunksize + int(n_rows % self.chunksize > 0)
         )
         # Create the initial temporary files, made of sorted data chunks.
         os.makedirs(self.tempdir)
         os.mkdir(os.path.join(self.tempdir, '0'))
-        with open(filepath, encoding=encoding) as initial_file:
-            # Read the file header if any and establish sorting function.
+        rows_encoding = _get_rows_encoding(encoding)
+        sep = sep.encode(rows_encoding)
+        with closing(_read_rows(filepath, encoding)) as initial_file:
+            # Read the file header if any and establish sorting parameters.
             header = next(initial_file) if has_header else None
             if sorting_axis is None:
                 # False positive on numpy C binding, pylint: disable=no-member
-                index = map(str, np.random.permutation(n_rows))
+                index = (b'%d' % i for i in np.random.permutation(n_rows))
                 initial_file = map(sep.join, zip(index, initial_file))
-                sorting_key = _alphanum_key
+                # Sort rows along their random integer index, using numpy.
+                sorting_axis = 0
+                numeric = True
             else:
                 if isinstance(sorting_axis, str):
-                    sorting_axis = header.split(sep).index(sorting_axis)
-                def sorting_key(value):
-                    """Contextual rows sorting key function."""
-                    return _alphanum_key(value.split(sep)[sorting_axis])
-            # Write the n-1 first temporary files.
-            for i in range(n_tempfiles - 1):
-                rows = (next(initial_file) for _ in range(self.chunksize))
-                sorted_rows = sorted(rows, key=sorting_key)
-                self._write_tempfile(sorted_rows, step=0, cardinal=i)
-            # Write the final temporary file.
-            self._write_tempfile(
-                sorted(list(initial_file), key=sorting_key),
-                step=0, cardinal=(n_tempfiles - 1)
+                    sorting_axis = header.rstrip(b'\r\n').split(sep).index(
+                        sorting_axis.encode(rows_encoding)
+                    )
+                numeric = None
+            chunks = (
+                list(itertools.islice(initial_file, self.chunksize))
+                for _ in range(max(n_tempfiles, 1))
+            )
+            # Sort numbers by value if the first chunk only holds some.
+            if numeric is None:
+                first_chunk = next(chunks)
+                values = [row.split(sep)[sorting_axis] for row in first_chunk]
+                numeric = _parse_numbers(values) is not None
+                chunks = itertools.chain([first_chunk], chunks)
+            # Write the temporary files, made of sorted chunks of rows.
+            numbers_only = self._sort_chunks(
+                chunks, sep, sorting_axis, numeric, rows_encoding
+            )
+        if numbers_only:
+            sorting_key = functools.partial(
+                _number_key, sep=sep, axis=sorting_axis
+            )
+        else:
+            # Memoize values' keys, as sorting values are often repeated.
+            value_key = functools.lru_cache(maxsize=self.chunksize)(
+                _numeric_key if numeric else _alphanum_key
+            )
+            sorting_key = functools.partial(
+                _column_key, sep=sep, axis=sorting_axis,
+                value_key=value_key, encoding=rows_encoding
             )
         print('Done creating initial temporary files.')
-        return header, sorting_key
+        return header, sorting_key, numbers_only
+
+    def _sort_chunks(self, chunks, sep, axis, numeric, encoding):
+        """Sort chunks of rows and write them to initial temporary files.
 
-    def _merging_steps(self, sorting_key):
+        Chunks are dispatched between `pool_size` processes if more
+        than one is used, otherwise they are sorted one by one, each
+        being written by a background thread while the next one is
+        read and sorted.
+
+        Return whether all sorting values were sorted as numbers.
+        """
+        # Arguments serve modularity, hence pylint: disable=too-many-arguments
+        paths = (
+            self._get_tempfile_path(step=0, cardinal=i)
+            for i in itertools.count()
+        )
+        if self.pool_size == 1:
+            return self._sort_chunks_serially(
+                chunks, paths, sep, axis, numeric, encoding
+            )
+        numbers_only = True
+        with ProcessPoolExecutor(self.pool_size) as executor:
+            pending = set()
+            for rows, path in zip(chunks, paths):
+                # Wait for a chunk to be written before reading too many.
+                if len(pending) >= 2 * self.pool_size:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        numbers_only &= future.result()
+                pending.add(executor.submit(
+                    _sort_to_tempfile, rows, path, sep, axis, numeric,
+                    encoding
+                ))
+            for future in pending:
+                numbers_only &= future.result()
+        return numbers_only
+
+    @staticmethod
+    def _sort_chunks_serially(chunks, paths, sep, axis, numeric, encoding):
+        """Sort chunks of rows, writing them to disk from a second thread.
+
+        Return whether all sorting values were sorted as numbers.
+        """
+        # Arguments serve modularity, hence pylint: disable=too-many-arguments
+        numbers_only = True
+        writing = None
+        with ThreadPoolExecutor(1) as writer:
+            for rows, path in zip(chunks, paths):
+                rows, is_numeric = (
+                    _sort_rows(rows, sep, axis, numeric, encoding)
+                )
+                numbers_only &= is_numeric
+                if writing is not None:
+                    writing.result()
+                writing = writer.submit(_write_rows, rows, path)
+            if writing is not None:
+                writing.result()
+        return numbers_only
+
+    def _merging_steps(self, sorting_key, numbers_only=False):
         """Iteratively merge temporary files into bigger (sorted) ones.
 
+        sorting_key  : row-sorting key function
+        numbers_only : whether all sorting keys are numbers, enabling
+                       the use of numpy to merge blocks of rows
+                       (bool, default False)
+
         Return the cardinal of the final step reached.
         """
         step_n = 0
@@ -174,33 +363,66 @@ class CsvSorter:
                 break
             # Merge sets of temporary files into new (sorted) temporary files.
             os.mkdir(os.path.join(self.tempdir, str(step_n + 1)))
-            files_range = range(0, len(temp_files), self.max_open)
-            for i, start in enumerate(files_range):
-                end = min(start + self.max_open, len(temp_files))
-                to_merge = [
-                    self._read_tempfile(step_n, filename)
-                    for filename in temp_files[start:end]
+            # Share the maximum number of open files between threads.
+            n_threads = max(1, min(
+                self.pool_size, len(temp_files) // 2, self.max_open // 2
+            ))
+            group_size = max(2, self.max_open // n_threads)
+            groups = [
+                temp_files[start:start + group_size]
+                for start in range(0, len(temp_files), group_size)
+            ]
+            with ThreadPoolExecutor(min(n_threads, len(groups))) as executor:
+                futures = [
+                    executor.submit(
+                        self._merge_group, group, step_n, i,
+                        sorting_key, numbers_only
+                    )
+                    for i, group in enumerate(groups)
                 ]
-                merged = heapq.merge(*to_merge, key=sorting_key)
-                self._write_tempfile(merged, step_n + 1, i)
+                for future in futures:
+                    future.result()
             # Delete previous temporary files and increment step.
             print('Done with merging step %s.' % step_n)
             shutil.rmtree(os.path.join(self.tempdir, str(step_n)))
             step_n += 1
         return step_n
 
+    def _merge_group(
+            self, filenames, step, cardinal, sorting_key, numbers_only
+        ):
+        """Merge a group of sorted temporary files into a new one.
+
+        filenames    : names of the temporary files to merge
+        step         : algorithm step reached by the files to merge
+        cardinal     : cardinal of the temporary file to create
+        sorting_key  : row-sorting key function
+        numbers_only : whether all sorting keys are numbers
+        """
+        # Arguments serve modularity, hence pylint: disable=too-many-arguments
+        to_merge = [
+            self._read_tempfile(step, filename) for filename in filenames
+        ]
+        if numbers_only:
+            block_size = max(self.chunksize // len(to_merge), 1)
+            merged = _merge_numbers(to_merge, sorting_key, block_size)
+        else:
+            merged = heapq.merge(*to_merge, key=sorting_key)
+        self._write_tempfile(merged, step + 1, cardinal)
+
     def _cleanup_step(
             self, output_file, final_step, header, remove_index, sep
         ):
         """Move the sorted file out of the temporary folder."""
         sorted_path = os.path.join(self.tempdir, str(final_step), '0.tmp')
-        with open(output_file, 'w', encoding='utf-8') as output:
+        with open(output_file, 'wb') as output:
             if header is not None:
                 output.write(header)
-            with open(sorted_path, encoding='utf-8') as sorted_file:
+            with open(sorted_path, 'rb') as sorted_file:
                 if remove_index:
-                    for row in sorted_file:
-                        output.write(row.split(sep, 1)[-1])
+                    output.writelines(
+                        row.split(sep, 1)[-1] for row in sorted_file
+                    )
                 else:
                     shutil.copyfileobj(sorted_file, output)
         shutil.rmtree(self.tempdir)
@@ -213,13 +435,191 @@ class CsvSorter:
         step     : algorithm step reached (implying a storage subfolder)
         cardinal : cardinal (turned into a name) of the temporary file
         """
-        path = os.path.join(self.tempdir, str(step), str(cardinal) + '.tmp')
-        with open(path, 'w', encoding='utf-8') as temporary_file:
-            temporary_file.writelines(rows)
+        _write_rows(rows, self._get_tempfile_path(step, cardinal))
+
+    def _get_tempfile_path(self, step, cardinal):
+        """Return the path to a temporary file of given indexes."""
+        return os.path.join(self.tempdir, str(step), str(cardinal) + '.tmp')
 
     def _read_tempfile(self, step, cardinal):
         """Yield rows from a tempfile of given indexes."""
         path = os.path.join(self.tempdir, str(step), str(cardinal))
-        with open(path, encoding='utf-8') as temporary_file:
+        with open(path, 'rb', buffering=READ_BUFFER_SIZE) as temporary_file:
+            # Hint the kernel at reading ahead, where supported.
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(
+                    temporary_file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL
+                )
             for row in temporary_file:
                 yield row
+
+
+def _column_key(row, sep, axis, value_key, encoding='utf-8'):
+    """Return the sorting key of a csv row, based on one of its fields.
+
+    row       : csv row whose key to return (bytes)
+    sep       : value separator of the row (bytes)
+    axis      : cardinal of the field along which to sort rows (int)
+    value_key : function returning the sorting key of the field's
+                (decoded) value
+    encoding  : encoding of the row (str, default 'utf-8')
+    """
+    return value_key(row.split(sep)[axis].decode(encoding))
+
+
+def _number_key(row, sep, axis):
+    """Return the numeric value of a given field of a csv row."""
+    return float(row.split(sep)[axis])
+
+
+def _numeric_key(value):
+    """Return a key sorting numbers by value, ahead of other strings.
+
+    Integers are kept as such, so that large ones are ordered exactly.
+    """
+    try:
+        return (0, int(value))
+    except ValueError:
+        pass
+    try:
+        number = float(value)
+    except ValueError:
+        return (1, _alphanum_key(value))
+    if math.isnan(number):
+        return (1, _alphanum_key(value))
+    return (0, number)
+
+
+def _parse_numbers(values, exact=False):
+    """Return an array of floats parsed from strings, or None if impossible.
+
+    values : list of strings (as bytes) to parse
+    exact  : whether to also return None when values may not be ordered
+             exactly once turned into floats, i.e. when some of them are
+             too long or overflow (bool, default False)
+    """
+    if exact:
+        lengths = (len(value.strip().lstrip(b'+-')) for value in values)
+        if any(length > FLOAT_DIGITS for length in lengths):
+            return None
+    try:
+        numbers = np.array(values, dtype=float)
+    except ValueError:
+        return None
+    if exact:
+        return numbers if np.isfinite(numbers).all() else None
+    return None if np.isnan(numbers).any() else numbers
+
+
+def _sort_rows(rows, sep, axis, numeric=False, encoding='utf-8'):
+    """Sort a list of csv rows along one of their fields.
+
+    When sorting numbers by value and all fields parse exactly as
+    floats, rows are ordered through numpy's (stable) mergesort. Otherwise,
+    the list of rows is sorted in place.
+
+    Return the sorted rows and a bool indicating whether all
+    sorting values were sorted as numbers.
+    """
+    if numeric:
+        numbers = _parse_numbers(
+            [row.split(sep)[axis] for row in rows], exact=True
+        )
+        if numbers is not None:
+            order = np.argsort(numbers, kind='mergesort')
+            return [rows[i] for i in order], True
+    sorting_key = functools.partial(
+        _column_key, sep=sep, axis=axis, encoding=encoding,
+        value_key=(_numeric_key if numeric else _alphanum_key)
+    )
+    rows.sort(key=sorting_key)
+    return rows, False
+
+
+def _merge_numbers(iterables, number_key, block_size):
+    """Merge sorted iterables of rows whose sorting keys are numbers.
+
+    Rows are fetched by blocks from each iterable, and all buffered
+    rows whose key is no greater than the smallest of the blocks'
+    last keys are ordered at once through numpy's (stable) mergesort.
+
+    iterables  : iterables yielding sorted rows
+    number_key : function returning a row's numeric sorting key
+    block_size : number of rows to fetch at once from an iterable
+    """
+    iterators = [iter(iterable) for iterable in iterables]
+    blocks = [[] for _ in iterators]
+    keys = [None for _ in iterators]
+    while True:
+        # Fetch new blocks of rows, discarding exhausted iterators.
+        for i in reversed(range(len(iterators))):
+            if not blocks[i]:
+                blocks[i] = list(itertools.islice(iterators[i], block_size))
+                if not blocks[i]:
+                    del iterators[i], blocks[i], keys[i]
+                    continue
+                keys[i] = np.fromiter(map(number_key, blocks[i]), float)
+        if not iterators:
+            break
+        # Yield all rows which may be placed before any unfetched one.
+        bound = min(block_keys[-1] for block_keys in keys)
+        rows = []
+        selected = []
+        for i, block_keys in enumerate(keys):
+            cut = np.searchsorted(block_keys, bound, side='right')
+            rows.extend(blocks[i][:cut])
+            selected.append(block_keys[:cut])
+            blocks[i] = blocks[i][cut:]
+            keys[i] = block_keys[cut:]
+        for j in np.argsort(np.concatenate(selected), kind='mergesort'):
+            yield rows[j]
+
+
+def _sort_to_tempfile(rows, path, sep, axis, numeric, encoding):
+    """Sort a list of csv rows and write them to a given temporary file.
+
+    Return whether all sorting values were sorted as numbers.
+    """
+    # Arguments serve modularity, hence pylint: disable=too-many-arguments
+    rows, numbers_only = _sort_rows(rows, sep, axis, numeric, encoding)
+    _write_rows(rows, path)
+    return numbers_only
+
+
+def _write_rows(rows, path):
+    """Write an iterable of rows (bytes) to a given temporary file."""
+    with open(path, 'wb') as temporary_file:
+        temporary_file.writelines(rows)
+
+
+@functools.lru_cache(maxsize=1)
+def _has_gnu_sort():
+    """Return whether the GNU 'sort' command is available."""
+    if shutil.which('sort') is None:
+        return False
+    try:
+        version = subprocess.check_output(
+            ['sort', '--version'], stderr=subprocess.DEVNULL
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return b'GNU' in version
+
+
+def _get_rows_encoding(encoding):
+    """Return the encoding of rows read from a file of given encoding."""
+    return encoding if is_ascii_compatible(encoding) else 'utf-8'
+
+
+def _read_rows(path, encoding):
+    """Yield the rows of a text file of given encoding, as bytes.
+
+    Rows are transcoded to utf-8 if the encoding is not ascii-compatible.
+    """
+    if is_ascii_compatible(encoding):
+        with open(path, 'rb') as text_file:
+            yield from text_file
+    else:
+        with open(path, encoding=encoding) as text_file:
+            for row in text_file:
+                yield row.encode('utf-8')
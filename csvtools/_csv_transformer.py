@@ -7,13 +7,21 @@ import gc
 import time
 import pickle
 import functools
+import math
 import multiprocessing
+import threading
+from collections import Counter
+from shutil import copyfileobj
 
 import pandas as pd
 from yaptools import check_type_validity, pool_transform, _wrap_apply
 from yaptools.logger import loggedmethod
 
-from csvtools import LargeCsvReader, CsvMerger, CsvSorter
+from csvtools import LargeCsvReader, CsvSorter
+from csvtools._utils import COPY_BUFFER_SIZE
+
+
+MAX_TASK_CHUNKS = 4  # maximum number of data chunks sent to a worker at once
 
 
 class LargeCsvTransformer(LargeCsvReader):
@@ -53,8 +61,83 @@ class LargeCsvTransformer(LargeCsvReader):
         * 'sort'          : sort the csv file along a given column
         * 'sort_randomly' : sort the csv file in a random order
         * 'value_counts'  : count unique values' occurences in a given column
+        * 'close'         : terminate the pool of workers used when storing
+                            transformed data, which is kept alive across
+                            calls made within a `with transformer:` block
+                            (hence, functions passed to workers must all
+                            exist before entering that block)
     """
 
+    def __init__(
+            self, filepath, chunksize=10000, logger=None, backend='pandas',
+            **kwargs
+        ):
+        """Initialize the csv transformer.
+
+        filepath  : path to a csv file
+        chunksize : number of rows to fetch at once (int, default 10000)
+        logger    : optional Logger object to use instead of the default
+                    one (which logs everything to the console)
+        backend   : name of the library to use so as to parse data,
+                    either 'pandas' (default) or 'pyarrow'
+
+        Additionally, any valid keyword arguments for csv reading using
+        the 'pandas.read_csv' function may be passed.
+        """
+        super().__init__(filepath, chunksize, logger, backend, **kwargs)
+        self._pool = None
+        self._pool_size = 0
+        self._keep_pool = False
+
+    def __enter__(self):
+        """Keep pools of workers alive across calls within the context.
+
+        Note: as workers are started when first needed, functions passed
+              to them must all be defined before entering the context.
+        """
+        self._keep_pool = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Terminate any pool of workers when exiting a context."""
+        self._keep_pool = False
+        self.close()
+
+    def __del__(self):
+        """Terminate any pool of workers upon deletion."""
+        self.close()
+
+    def __getstate__(self):
+        """Return the object's state to pickle, without any pool of workers.
+
+        This enables passing the object's own methods to workers.
+        """
+        state = self.__dict__.copy()
+        state.update({'_pool': None, '_pool_size': 0, '_keep_pool': False})
+        return state
+
+    def close(self):
+        """Terminate the current pool of workers, if any."""
+        if getattr(self, '_pool', None) is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+            self._pool_size = 0
+
+    def _get_pool(self, pool_size):
+        """Return a pool of workers of given size, creating it if needed.
+
+        Within a `with` block, the pool is kept alive across calls
+        requiring the same number of workers, so as to save the cost of
+        starting up processes. Otherwise, it is closed after each call.
+        """
+        if self._pool_size != pool_size:
+            self.close()
+            # Pool is closed by 'close', pylint: disable=consider-using-with
+            self._pool = multiprocessing.Pool(pool_size)
+            self._pool_size = pool_size
+        return self._pool
+
     @loggedmethod
     def map(
             self, function, read_kwargs=None, pool_size=1, output_file=None,
@@ -135,16 +218,23 @@ class LargeCsvTransformer(LargeCsvReader):
         check_type_validity(read_kwargs, (dict, type(None)), 'read_kwargs')
         if read_kwargs is None:
             read_kwargs = {}
+        gc_time = 0.
         for chunk in self.read(**read_kwargs):
+            start = time.perf_counter()
             transformed = pool_transform(
                 chunk, function, pool_size, apply_func, aggregate, **kwargs
             )
+            run_time = time.perf_counter() - start
             if aggregate is None and pool_size > 1:
                 for result in transformed:
                     yield result
             else:
                 yield transformed
-            gc.collect()
+            # Only collect garbage when it is cheap relative to computations.
+            if run_time > 5 * gc_time:
+                start = time.perf_counter()
+                gc.collect()
+                gc_time = time.perf_counter() - start
 
     @staticmethod
     def _check_output_file_validity(output_file):
@@ -152,10 +242,9 @@ class LargeCsvTransformer(LargeCsvReader):
         check_type_validity(output_file, str, 'output_file')
         if not output_file.endswith(os.path.extsep + 'csv'):
             raise ValueError('Incorrect file extension (expected csv).')
-        path = os.path.normpath(output_file)
-        dirname = os.path.dirname(path)
-        if not (dirname == '' or os.path.isdir(dirname)):
-            os.makedirs(os.path.dirname(path))
+        dirname = os.path.dirname(os.path.normpath(output_file))
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
 
     def _transform_store(
             self, function, output_file, read_kwargs=None, pool_size=1,
@@ -190,65 +279,160 @@ class LargeCsvTransformer(LargeCsvReader):
         )
         chunksize = read_kwargs.get('chunksize', self.chunksize)
         read_kwargs['chunksize'] = chunksize
-        temp_name = ('_part{0}' + os.path.extsep).join(
-            output_file.rsplit(os.path.extsep, 1)
-        )
         # Conduct actual transformation and storage of data chunks.
-        temp_files = self.__transform_to_temporary_files(
-            function, read_kwargs, pool_size, temp_name
-        )
-        self.__merge_temporary_files(temp_files, output_file)
+        self.__transform_to_csv(function, read_kwargs, pool_size, output_file)
 
-    def __transform_to_temporary_files(
-            self, function, read_kwargs, pool_size, temp_name
+    def __transform_to_csv(
+            self, function, read_kwargs, pool_size, output_file
         ):
-        """Multiprocess the transformation and storage to temp files of data.
+        """Multiprocess the transformation of data and its storage to csv.
+
+        Transformed chunks are written to the output file as they come,
+        in the order of the initial data. Results which are neither a
+        pandas.Series nor DataFrame are pickled to side files instead.
 
         This method is to be called from the '_transform_store' one, which
         sets up its arguments in accordance with API-level inputs.
         """
-        temp_files = []
-        with multiprocessing.Pool(pool_size) as pool:
-            for i, chunk in enumerate(self.read(**read_kwargs)):
-                callback = functools.partial(
-                    self.__write_to_csv, write_index=True,
-                    output_file=temp_name.format(i)
-                )
-                pool.apply_async(
-                    function, (chunk,), callback=callback,
-                    error_callback=self.log_exception
-                )
-                temp_files.append(temp_name.format(i))
-                # Wait until a pool worker is available.
-                # No other way to do so, thus pylint: disable=protected-access
-                while len(pool._cache) >= pool_size:
-                    time.sleep(1)
-            pool.close()
-            pool.join()
-        return temp_files
-
-    def __write_to_csv(self, chunk, output_file, write_index=True):
-        """Write a given data chunk to csv. Pickle it on type invalidity.
-
-        output_file : path to a csv file where to write the data chunk
-        write_index : whether to write the index (bool, default True)
-        """
-        if isinstance(chunk, pd.Series):
-            chunk = pd.DataFrame(chunk)
-        if isinstance(chunk, pd.DataFrame):
-            chunk.to_csv(
-                output_file, mode='w', encoding='utf-8',
-                header=True, index=write_index, sep=';'
+        # Steps are best kept together, hence pylint: disable=too-many-locals
+        pickle_name = ('_part{0}' + os.path.extsep + 'pickle').join(
+            output_file.rsplit(os.path.extsep + 'csv', 1)
+        )
+        # Batch chunks sent to workers, within memory-bound limits.
+        n_chunks = self._estimate_num_chunks(read_kwargs)
+        task_size = MAX_TASK_CHUNKS if n_chunks is None else min(
+            max(1, n_chunks // (pool_size + 2)), MAX_TASK_CHUNKS
+        )
+        # Bound the number of chunks either being processed or awaiting
+        # to be written, as results are gathered in order.
+        semaphore = threading.Semaphore(2 * pool_size * task_size)
+        stopped = threading.Event()
+        def read_chunks():
+            """Yield enumerated data chunks as the semaphore allows it."""
+            for item in enumerate(self.read(**read_kwargs)):
+                # Released as results come, pylint: disable=consider-using-with
+                semaphore.acquire()
+                if stopped.is_set():
+                    break
+                yield item
+        columns = template = None
+        failed = []
+        results = self._get_pool(pool_size).imap(
+            functools.partial(_indexed_call, function), read_chunks(),
+            chunksize=task_size
+        )
+        try:
+            with open(output_file, 'w', encoding='utf-8', newline='') as file:
+                for i, result, exception in results:
+                    semaphore.release()
+                    if exception is not None:
+                        self.log_exception(exception)
+                        failed.append(i)
+                    elif isinstance(result, (pd.Series, pd.DataFrame)):
+                        if template is None:
+                            template = pd.DataFrame(result.iloc[:0])
+                        columns = self.__write_to_csv(result, file, columns)
+                    else:
+                        self.__pickle_record(result, pickle_name.format(i))
+                        failed.append(i)
+        except BaseException:
+            # Stop reading data and discard the workers' pending tasks.
+            stopped.set()
+            semaphore.release()
+            self.close()
+            raise
+        finally:
+            if not self._keep_pool:
+                self.close()
+        # Columns absent from the first chunk were appended to the header.
+        if template is not None and len(columns) > len(template.columns):
+            self.__update_csv_header(output_file, template, columns)
+        if failed:
+            self.log(
+                "Chunks %s are missing from '%s'." % (failed, output_file),
+                level='error'
             )
+        else:
             self.log(
-                "Successfully wrote '%s' (%s rows)."
-                % (output_file, len(chunk)), 'info'
+                "Successfully wrote transformed data to '%s'." % output_file,
+                level='info'
             )
+
+    def _estimate_num_chunks(self, read_kwargs):
+        """Return the number of chunks 'read' yields given some arguments.
+
+        read_kwargs : dictionary specifying valid reading parameters
+                      for the 'LargeCsvReader.read' method
+
+        Return None if the file's length is unknown, as counting its
+        lines would require reading the whole file beforehand.
+        """
+        # Only use the lazy '_len' attribute if it was already computed.
+        if '_len' not in self.__dict__:
             return None
-        # Verbosely pickle the record in case of type invalidity.
-        with open(output_file[:-3] + 'pickle', 'wb') as dump:
+        chunksize = read_kwargs.get('chunksize') or self.chunksize
+        skiprows = read_kwargs.get('skiprows') or 0
+        if read_kwargs.get('skipchunks') is not None:
+            skiprows = read_kwargs['skipchunks'] * chunksize
+        n_rows = max(0, self.__dict__['_len'] - skiprows)
+        if read_kwargs.get('nrows') is not None:
+            n_rows = min(n_rows, read_kwargs['nrows'])
+        return max(1, math.ceil(n_rows / chunksize))
+
+    def __write_to_csv(self, chunk, csv_file, columns=None):
+        """Append a data chunk, with its index, to an open csv file.
+
+        chunk    : pandas.Series or pandas.DataFrame to write
+        csv_file : text file object to which to write the chunk
+        columns  : optional list of the csv file's columns, along which
+                   to align the chunk (if None, a header is written)
+
+        Return the list of the csv file's columns.
+        """
+        # Write pandas.Series as such, sparing their conversion to frames.
+        if isinstance(chunk, pd.Series):
+            names = [0 if chunk.name is None else chunk.name]
+        else:
+            names = chunk.columns.tolist()
+        write_header = columns is None
+        if write_header:
+            columns = names
+        elif names != columns:
+            if isinstance(chunk, pd.Series):
+                chunk = chunk.to_frame(names[0])
+            # Keep columns absent from previous chunks, which are appended
+            # to the header once all chunks have been written.
+            columns = columns + [name for name in names if name not in columns]
+            chunk = chunk.reindex(columns=columns)
+        chunk.to_csv(
+            csv_file, header=write_header, index=True, sep=';'
+        )
+        self.log('Successfully wrote %s rows.' % len(chunk), 'info')
+        return columns
+
+    def __update_csv_header(self, path, template, columns):
+        """Rewrite the header of a csv file written by '__write_to_csv'.
+
+        path     : path to the csv file whose header to rewrite
+        template : empty pandas.DataFrame sharing the index of written data
+        columns  : full list of the csv file's columns
+        """
+        header = template.reindex(columns=columns).to_csv(sep=';', index=True)
+        # The file's raw contents are copied below the updated header.
+        tempname = path.rsplit('.', 1)[0] + '.temp'
+        with open(path, 'rb') as infile:
+            with open(tempname, 'wb') as outfile:
+                infile.readline()
+                outfile.write(header.encode('utf-8'))
+                copyfileobj(infile, outfile, COPY_BUFFER_SIZE)
+        os.replace(tempname, path)
+        self.log("Updated the header of '%s'." % path, level='info')
+
+    def __pickle_record(self, record, path):
+        """Verbosely pickle a record whose type is invalid for csv storage."""
+        with open(path, 'wb') as dump:
             try:
-                pickle.dump(chunk, dump)
+                pickle.dump(record, dump)
             except pickle.PicklingError as exception:
                 pickling_msg = 'Attempt to pickle it failed: %s.' % (
                     'PicklingError: ' + ';'.join(map(str, exception.args))
@@ -257,33 +441,7 @@ class LargeCsvTransformer(LargeCsvReader):
                 pickling_msg = 'Suscessfully pickled it.'
         self.log(
             "Invalid record type: '%s'. %s"
-            % (type(chunk).__name__, pickling_msg), level='error'
-        )
-
-    def __merge_temporary_files(self, temp_files, output_file):
-        """Merge a list of temporary csv files if none of them are missing.
-
-        temp_files  : list of paths to the temporary csv files
-        output_file : path to the csv file to merge files into which
-        """
-        missing = [
-            path for path in temp_files if not os.path.isfile(path)
-        ]
-        if missing:
-            self.log(
-                'Missing temporary files: %s. Merging aborted.' % missing,
-                level='info'
-            )
-            return None
-        self.log('Starting to merge temporary file...', 'info')
-        csv_merger = CsvMerger(os.path.dirname(output_file))
-        csv_merger.stage(temp_files)
-        csv_merger.merge_staged_files(
-            os.path.basename(output_file), sort_files=True
-        )
-        self.log(
-            'Successfully merged temporary files into %s.' % output_file,
-            level='info'
+            % (type(record).__name__, pickling_msg), level='error'
         )
 
     def value_counts(self, column, normalize=False, pool_size=1):
@@ -298,10 +456,16 @@ class LargeCsvTransformer(LargeCsvReader):
         """
         check_type_validity(column, str, 'column')
         read_kwargs = {'usecols': [column], 'as_series': True}
-        counts = pd.Series(name=column)
-        for count in self.map(pd.Series.value_counts, read_kwargs, pool_size):
-            counts = counts.add(count, fill_value=0, )
-        return counts / len(self) if normalize else counts.apply(int)
+        counts = Counter()
+        # Chunk-wise counts need not be sorted, as they are aggregated.
+        chunks_counts = self.map(
+            pd.Series.value_counts, read_kwargs, pool_size, sort=False
+        )
+        for count in chunks_counts:
+            counts.update(count.to_dict())
+        # Sort values once, so that results do not depend on chunking.
+        counts = pd.Series(counts, name=column, dtype=int).sort_index()
+        return counts / len(self) if normalize else counts
 
     @loggedmethod
     def sort(
@@ -343,3 +507,18 @@ class LargeCsvTransformer(LargeCsvReader):
                          with the sorted one (bool, default True)
         """
         self.sort(output_file, None, assign_as_data)
+
+
+def _indexed_call(function, item):
+    """Call a function on an (index, data) tuple in a pool worker.
+
+    Return the index, the result and None, or, if an exception was
+    raised, the index, None and the exception, so that the latter
+    may be logged by the parent process.
+    """
+    index, data = item
+    try:
+        return index, function(data), None
+    # Catch any exception, by design. pylint: disable=broad-except
+    except Exception as exception:
+        return index, None, exception
@@ -2,13 +2,20 @@
 
 """Generic class to handle dynamic csv storage records flows."""
 
+from queue import Empty
 from shutil import copyfileobj
 import pickle
 import os
+import sys
 from abc import ABCMeta, abstractmethod
 
 from yaptools.logger import LoggedObject, loggedmethod
 
+from csvtools._utils import COPY_BUFFER_SIZE
+
+
+WRITE_BUFFER_SIZE = 1 << 20  # size (in bytes) of the csv file's write buffer
+HEADER_READ_SIZE = 1 << 16  # size (in bytes) of header reading operations
 
 CSV_WRITER_DOCSTRING = """
     The task resolved here is to store dynamically some data into a csv
@@ -52,6 +59,7 @@ CSV_WRITER_EXAMPLE = """
 """
 
 
+# State is shared by all writers, pylint: disable=too-many-instance-attributes
 class AbstractCsvWriter(LoggedObject, metaclass=ABCMeta):
     """Abstract class to handle dynamic csv storage of a flow of records.
     {0}
@@ -61,9 +69,11 @@ class AbstractCsvWriter(LoggedObject, metaclass=ABCMeta):
     types of data records (e.g. dict). Those abstract methods are:
 
       * _reset_buffer       : set self.buffer to its "empty" state
-      * _add_to_buffer      : add a record to self.buffer
+      * _add_to_buffer      : add a record to self.buffer (or reject it)
+                              and return False if it was rejected
       * _get_buffer_columns : return the self.buffer's current column names
       * _to_csv             : dump self.buffer's contents to the csv file
+                              (which '_get_csv_file' returns opened)
 
 
     "Abstract" usage (requiring the previously listed overridings):
@@ -74,7 +84,9 @@ class AbstractCsvWriter(LoggedObject, metaclass=ABCMeta):
     """
     __doc__ = __doc__.format(CSV_WRITER_DOCSTRING, CSV_WRITER_EXAMPLE)
 
-    def __init__(self, path, buffer_size, sep=';', logger=None):
+    def __init__(
+            self, path, buffer_size, sep=';', logger=None, max_bytes=None
+        ):
         """Set up the handler's initial state.
 
         path        : path to the destination csv file, which may pre-exist
@@ -83,13 +95,19 @@ class AbstractCsvWriter(LoggedObject, metaclass=ABCMeta):
         sep         : values separator of the csv file (str, default ';')
         logger      : optional Logger object to use instead of the default
                       one (which logs everything to the console)
+        max_bytes   : optional (estimated) size of the buffered records,
+                      in bytes, past which to write them to the csv file
+                      even if there are less than `buffer_size` rows
         """
         path = os.path.normpath(path)
         self._check_path_validity(path)
         self.path = path
+        self._csv_file = None
         self.buffer_size = buffer_size
+        self.max_bytes = max_bytes
         self.buffer = None
         self._reset_buffer()
+        self._buffer_bytes = 0
         self.number_of_rows_stored = 0
         self.sep = sep
         self.header = self._get_current_csv_header()
@@ -108,37 +126,91 @@ class AbstractCsvWriter(LoggedObject, metaclass=ABCMeta):
 
     def _get_current_csv_header(self):
         """Read the csv file's initial header, if any."""
-        header = []
-        if os.path.exists(self.path) and os.stat(self.path).st_size > 0:
-            with open(self.path, 'r', encoding='utf-8') as csv_file:
-                header = csv_file.readline().strip('\n').split(self.sep)
-        return header
+        if not os.path.isfile(self.path):
+            return []
+        # Read raw bytes until the first line feed, mostly in a single call.
+        chunks = []
+        file_id = os.open(self.path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            chunk = os.read(file_id, HEADER_READ_SIZE)
+            while chunk:
+                chunks.append(chunk)
+                if b'\n' in chunk:
+                    break
+                chunk = os.read(file_id, HEADER_READ_SIZE)
+        finally:
+            os.close(file_id)
+        if not chunks:
+            return []
+        line = b''.join(chunks).split(b'\n', 1)[0].rstrip(b'\r')
+        return line.decode('utf-8').split(self.sep)
 
     def handle_queue(self, queue):
-        """Handle a records flow drawn from a Queue."""
-        record = queue.get()
-        while record is not None:
-            if isinstance(record, list):
-                for _record in record:
-                    self.handle_record(_record)
-            else:
-                self.handle_record(record)
-            record = queue.get()
-        self.finish_handling_procedure()
+        """Handle a records flow drawn from a Queue.
+
+        Records are drawn by batches of all those available at once (up
+        to `buffer_size` ones), until a None is drawn, which ends the
+        handling procedure.
+        """
+        while True:
+            records = [queue.get()]
+            try:
+                while records[-1] is not None:
+                    if len(records) >= self.buffer_size:
+                        break
+                    records.append(queue.get_nowait())
+            except Empty:
+                pass
+            for record in records:
+                if record is None:
+                    self.finish_handling_procedure()
+                    return None
+                if isinstance(record, list):
+                    for _record in record:
+                        self.handle_record(_record)
+                else:
+                    self.handle_record(record)
 
     def handle_record(self, record):
         """Bufferize a record and write the buffer to disk if it's full."""
-        self._add_to_buffer(record)
-        if len(self.buffer) >= self.buffer_size:
+        # Rejection is explicit, as overridings may return None otherwise.
+        if self._add_to_buffer(record) is False:
+            return None
+        is_full = self._get_buffer_length() >= self.buffer_size
+        if self.max_bytes is not None and not is_full:
+            self._buffer_bytes += self._get_record_size(record)
+            is_full = self._buffer_bytes >= self.max_bytes
+        if is_full:
             self._write_buffer_to_disk()
 
     def finish_handling_procedure(self):
         """Write the buffer to disk and update the csv header if needed."""
-        if self.buffer:
+        if self._get_buffer_length():
             self._write_buffer_to_disk()
+        self.close()
         if self._has_changed:
             self._update_csv_header()
 
+    def close(self):
+        """Close the csv file, if it is open."""
+        if self._csv_file is not None:
+            self._csv_file.close()
+            self._csv_file = None
+
+    def _get_csv_file(self):
+        """Return the csv file opened in append mode, opening it if needed.
+
+        The file is kept open across buffer writes, until either the
+        'close' or 'finish_handling_procedure' method is called.
+        """
+        if self._csv_file is None:
+            # File is closed by 'close', pylint: disable=consider-using-with
+            self._csv_file = open(
+                self.path, 'a', encoding='utf-8', newline='',
+                buffering=WRITE_BUFFER_SIZE
+            )
+        return self._csv_file
+
     def _write_buffer_to_disk(self):
         """Write buffered elements to csv. On failure, serialize them."""
         try:
@@ -152,6 +224,7 @@ class AbstractCsvWriter(LoggedObject, metaclass=ABCMeta):
             )
             self._serialize_buffer()
         self._reset_buffer()
+        self._buffer_bytes = 0
 
     def _write_buffer(self):
         """Write buffered elements to csv, tracking changes and advancement."""
@@ -166,15 +239,25 @@ class AbstractCsvWriter(LoggedObject, metaclass=ABCMeta):
         # Write rows to csv.
         self._to_csv(first_time)
         # Log success.
-        self.number_of_rows_stored += len(self.buffer)
+        n_rows = self._get_buffer_length()
+        self.number_of_rows_stored += n_rows
         self.log(
             "Successfully wrote %s rows to '%s' (total: %s)." % (
-                len(self.buffer), os.path.basename(self.path),
+                n_rows, os.path.basename(self.path),
                 self.number_of_rows_stored
             ),
             level='info'
         )
 
+    def _get_buffer_length(self):
+        """Return the number of rows currently held in the buffer."""
+        return len(self.buffer)
+
+    @staticmethod
+    def _get_record_size(record):
+        """Return the estimated size of a given record, in bytes."""
+        return sys.getsizeof(record)
+
     def _serialize_buffer(self):
         """Serialize the current buffer list."""
         path = os.path.join(os.path.dirname(self.path), 'buffer_{0}.pickle')
@@ -192,7 +275,7 @@ class AbstractCsvWriter(LoggedObject, metaclass=ABCMeta):
         else:
             self.log(
                 'Serialized %s rows under id %s.'
-                % (len(self.buffer), id(self.buffer)),
+                % (self._get_buffer_length(), id(self.buffer)),
                 level='info'
             )
 
@@ -200,14 +283,17 @@ class AbstractCsvWriter(LoggedObject, metaclass=ABCMeta):
     def _update_csv_header(self):
         """Update the csv file's header."""
         self.log('Updating the csv file\'s header...', 'info')
+        self.close()
+        # As columns are only ever added, the header cannot be rewritten
+        # in place; the file's raw contents are thus copied below it.
         tempname = self.path.rsplit('.', 1)[0] + '.temp'
-        with open(self.path, 'r', encoding='utf-8') as infile:
-            with open(tempname, 'w', encoding='utf-8') as outfile:
+        with open(self.path, 'rb') as infile:
+            with open(tempname, 'wb') as outfile:
                 infile.readline()
-                outfile.write(self.sep.join(self.header) + '\n')
-                copyfileobj(infile, outfile)
-        os.remove(self.path)
-        os.rename(tempname, self.path)
+                header = self.sep.join(self.header) + '\n'
+                outfile.write(header.encode('utf-8'))
+                copyfileobj(infile, outfile, COPY_BUFFER_SIZE)
+        os.replace(tempname, self.path)
         self._has_changed = False
         self.log('Succesfully updated the csv file\'s header.', 'info')
 
@@ -218,7 +304,7 @@ class AbstractCsvWriter(LoggedObject, metaclass=ABCMeta):
 
     @abstractmethod
     def _add_to_buffer(self, record):
-        """Bufferize a given record."""
+        """Bufferize a given record, returning False if it was rejected."""
         raise NotImplementedError('No method defined to bufferize records.')
 
     @abstractmethod
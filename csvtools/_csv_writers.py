@@ -2,7 +2,9 @@
 
 """Classes to handle record-type specific dynamic csv storage."""
 
-from functools import reduce
+import sys
+from collections import OrderedDict
+from operator import methodcaller
 
 import pandas as pd
 from yaptools import check_type_validity
@@ -12,6 +14,9 @@ from csvtools._csv_writer import (
 )
 
 
+TO_CSV_CHUNKSIZE = 65536  # number of rows serialized at once by pandas
+
+
 class DictCsvWriter(AbstractCsvWriter):
     """Class to handle dynamic csv storage of dict records.
     {0}
@@ -27,43 +32,60 @@ class DictCsvWriter(AbstractCsvWriter):
     def _reset_buffer(self):
         """Reset the buffer to its empty state."""
         self.buffer = []
+        self._col_index = OrderedDict()
 
     def _add_to_buffer(self, record):
-        """Bufferize a given dict."""
+        """Bufferize a given dict, returning False if it was rejected."""
         if not isinstance(record, dict):
             self.log(
                 'Rejected a record: invalid type %s.' % type(record),
                 level='error'
             )
-            return None
+            return False
         self.buffer.append(record)
+        # Record column names as they come, using an ordered dict as a set.
+        self._col_index.update(OrderedDict.fromkeys(record))
+        return True
 
     def _get_buffer_columns(self):
         """Return a list of unique column names appearing in the buffer."""
-        return reduce(
-            lambda x, y: list(set(x + y)),
-            map(lambda dict_x: list(dict_x.keys()), self.buffer)
-        )
+        return list(self._col_index)
+
+    @staticmethod
+    def _get_record_size(record):
+        """Return the estimated size of a given dict, in bytes."""
+        return sys.getsizeof(record) + sum(map(sys.getsizeof, record.values()))
 
     def _to_csv(self, first_time):
         """Write buffered elements to csv."""
-        def clean_row(string, replace):
-            """Clean a record row."""
-            string = string.replace(self.sep, replace.get(self.sep, '§'))
-            return string.replace('\n', '')
-        replace = {';': '.,', '§': ';'}
-        rows = (
-            self.sep.join(
-                clean_row(str(row.get(column, '')), replace)
-                for column in self.header
-            )
-            for row in self.buffer
-        )
-        with open(self.path, 'a', encoding='utf-8') as csv_file:
-            if first_time:
-                csv_file.write(self.sep.join(self.header) + '\n')
-            for row in rows:
-                csv_file.write(row + '\n')
+        sep = self.sep
+        replace = {';': '.,', '§': ';'}.get(sep, '§')
+        # Translation tables only handle single-character separators.
+        if len(sep) == 1:
+            table = str.maketrans({sep: replace, '\n': ''})
+            clean = methodcaller('translate', table)
+        else:
+            def clean(value):
+                """Replace value separators and line feeds within a value."""
+                return value.replace(sep, replace).replace('\n', '')
+        header = tuple(self.header)
+        blanks = ('',) * len(header)
+        n_seps = len(header) - 1
+        def format_row(row):
+            """Format a record as a csv row, cleaning values if needed."""
+            line = sep.join(map(str, map(row.get, header, blanks)))
+            # Replace value separators and line feeds within values,
+            # in the (rare) cases when any value contains some.
+            if line.count(sep) != n_seps or '\n' in line:
+                line = sep.join(
+                    clean(str(row.get(column, ''))) for column in header
+                )
+            return line + '\n'
+        csv_file = self._get_csv_file()
+        if first_time:
+            csv_file.write(sep.join(header) + '\n')
+        csv_file.writelines(map(format_row, self.buffer))
+        csv_file.flush()
 
 
 class DataframeCsvWriter(AbstractCsvWriter):
@@ -79,7 +101,8 @@ class DataframeCsvWriter(AbstractCsvWriter):
     __doc__ = __doc__.format(CSV_WRITER_DOCSTRING, CSV_WRITER_EXAMPLE)
 
     def __init__(
-            self, path, buffer_size, sep=';', logger=None, write_index=False
+            self, path, buffer_size, sep=';', logger=None, write_index=False,
+            max_bytes=None
         ):
         """Set up the handler's initial state.
 
@@ -93,10 +116,15 @@ class DataframeCsvWriter(AbstractCsvWriter):
                       (bool, default False) ; note that index will be written
                       if using a pre-existing file whose first column is not
                       named
+        max_bytes   : optional (estimated) size of the buffered records,
+                      in bytes, past which to write them to the csv file
+                      even if there are less than `buffer_size` rows
         """
         check_type_validity(write_index, bool, 'write_index')
         self._write_index = write_index
-        super().__init__(path, buffer_size, sep, logger)
+        self._record_type = None
+        self._to_frame = None
+        super().__init__(path, buffer_size, sep, logger, max_bytes)
 
     def _get_current_csv_header(self):
         """Read the csv file's initial header, if any."""
@@ -108,35 +136,63 @@ class DataframeCsvWriter(AbstractCsvWriter):
 
     def _reset_buffer(self):
         """Reset the buffer to its empty state."""
-        self.buffer = pd.DataFrame()
+        self.buffer = []
+        self._row_count = 0
 
     def _add_to_buffer(self, record):
-        """Bufferize a given pandas.DataFrame."""
+        """Bufferize a given pandas.DataFrame, returning False if rejected."""
+        # Only check types anew when they differ from the last record's,
+        # which calls for exact types comparison, hence
+        # pylint: disable=unidiomatic-typecheck
+        if type(record) is not self._record_type:
+            if isinstance(record, pd.Series):
+                self._to_frame = pd.Series.to_frame
+            elif isinstance(record, pd.DataFrame):
+                self._to_frame = None
+            else:
+                self.log(
+                    'Rejected a record: invalid type %s.' % type(record),
+                    level='error'
+                )
+                return False
+            self._record_type = type(record)
+        if self._to_frame is not None:
+            record = self._to_frame(record)
+        # Records are concatenated only once, when writing them to csv.
+        self.buffer.append(record)
+        self._row_count += len(record)
+        return True
+
+    def _get_buffer_length(self):
+        """Return the number of rows currently held in the buffer."""
+        return self._row_count
+
+    @staticmethod
+    def _get_record_size(record):
+        """Return the estimated size of a given record, in bytes."""
         if isinstance(record, pd.Series):
-            record = pd.DataFrame(record)
-        elif not isinstance(record, pd.DataFrame):
-            self.log(
-                'Rejected a record: invalid type %s.' % type(record),
-                level='error'
-            )
-            return None
-        self.buffer = pd.concat([self.buffer, record])
+            return record.memory_usage(index=False)
+        return record.memory_usage(index=False).sum()
 
     def _get_buffer_columns(self):
         """Return a list of unique column names appearing in the buffer."""
-        return list(self.buffer.columns)
+        columns = OrderedDict()
+        for record in self.buffer:
+            columns.update(OrderedDict.fromkeys(record.columns))
+        return list(columns)
 
     def _to_csv(self, first_time):
         """Write buffered elements to csv."""
-        if self.buffer.columns.tolist() != self.header:
-            for column in self.header:
-                if column not in self.buffer.columns:
-                    self.buffer[column] = None
-            self.buffer = self.buffer[self.header]
-        self.buffer.to_csv(
-            self.path, sep=self.sep, mode='a', index=self._write_index,
-            header=self.header if first_time else None, encoding='utf-8'
+        data = pd.concat(self.buffer)
+        if data.columns.tolist() != self.header:
+            data = data.reindex(columns=self.header)
+        csv_file = self._get_csv_file()
+        data.to_csv(
+            csv_file, sep=self.sep, index=self._write_index,
+            header=self.header if first_time else False,
+            chunksize=TO_CSV_CHUNKSIZE
         )
+        csv_file.flush()
 
     def _update_csv_header(self):
         """Update the csv file's header."""
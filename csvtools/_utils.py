@@ -0,0 +1,38 @@
+# coding: utf-8
+
+"""Auxiliary functions shared by csvtools classes."""
+
+
+COPY_BUFFER_SIZE = 1 << 20  # size (in bytes) of raw copy operations' buffer
+
+
+def count_lines(path, encoding='utf-8', buffer_size=1 << 20):
+    """Return the number of lines of a given text file.
+
+    path        : path to the file whose lines to count
+    encoding    : encoding of the file (str, default 'utf-8')
+    buffer_size : number of bytes read at once (int, default 1 MiB)
+
+    Line feeds are counted over raw bytes whenever the encoding allows
+    it (which is the case of utf-8 and other ascii-compatible ones),
+    avoiding decoding the file's contents.
+    """
+    if not is_ascii_compatible(encoding):
+        with open(path, encoding=encoding) as text_file:
+            return sum(1 for _ in text_file)
+    n_lines = 0
+    last_char = b'\n'
+    with open(path, 'rb') as binary_file:
+        chunk = binary_file.read(buffer_size)
+        while chunk:
+            n_lines += chunk.count(b'\n')
+            last_char = chunk[-1:]
+            chunk = binary_file.read(buffer_size)
+    # Count the last line if it does not end with a line feed.
+    return n_lines + (last_char != b'\n')
+
+
+def is_ascii_compatible(encoding):
+    """Return whether a given encoding leaves ascii characters as such."""
+    ascii_chars = bytes(range(128))
+    return ascii_chars.decode('ascii').encode(encoding) == ascii_chars
@@ -22,6 +22,9 @@ setuptools.setup(
         'pandas >= 0.20.1',
         'yaptools >= 0.1'
     ],
+    extras_require={
+        'pyarrow': ['pyarrow >= 1.0']
+    },
     classifiers=[
         "Programming Language :: Python",
         "Programming Language :: Python :: 3.6",